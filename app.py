@@ -1,16 +1,16 @@
 # External packages
 import streamlit as st
-import whisper
 
 # Python In-built packages
-import pandas as pd
+# (torch, faster_whisper, numpy, pandas, and pydub are imported lazily
+# inside the functions that use them so first paint doesn't pay for them)
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
+import gc
+import hashlib
 import time
-import tempfile
-from pathlib import Path
+import asyncio
 from audiorecorder import audiorecorder
-from streamlit.runtime.uploaded_file_manager import UploadedFile
-from openai import OpenAI
 
 @st.cache_resource
 def create_client():
@@ -20,26 +20,84 @@ def create_client():
     Returns:
     - OpenAI: An instance of the OpenAI client.
     """
+    from openai import OpenAI
+
     client = OpenAI(api_key=st.secrets.OPENAI_API_KEY)
     return client
 
-TEMP_DIR = Path(tempfile.gettempdir())
+@st.cache_resource
+def create_async_client():
+    """
+    Creates an async OpenAI client so multi-file uploads overlap on the socket.
+
+    Returns:
+    - AsyncOpenAI: An instance of the async OpenAI client.
+    """
+    from openai import AsyncOpenAI
+
+    client = AsyncOpenAI(api_key=st.secrets.OPENAI_API_KEY)
+    return client
+
+class RecordedFile(BytesIO):
+    # minimal stand-in for an uploaded file: the WAV bytes plus the .name
+    # the rest of the pipeline expects
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
 
 @st.cache_resource()
-def create_whisper_model(
-    model_path : str = "model/medium.en.pt",
+def create_whisper_models(
+    model_path : str = "model/medium.en-ct2",
 ):
     """
-    Create a Whisper model for text transcription.
+    Create one Whisper pipeline per available GPU for text transcription.
 
     Args:
-        model_path (str): The path to the Llama model.
-        
+        model_path (str): Path to the int8-quantized CTranslate2 model directory.
+            Convert the checkpoint once with:
+            ct2-transformers-converter --model openai/whisper-medium.en \
+                --output_dir model/medium.en-ct2 --quantization int8
+
+    Returns:
+        list[BatchedInferencePipeline]: One pipeline per GPU, or a single
+            CPU pipeline when no GPU is available.
+    """
+    import torch
+    from faster_whisper import WhisperModel, BatchedInferencePipeline
+
+    cuda = torch.cuda.is_available()
+    pipelines = []
+    for device_index in range(torch.cuda.device_count() if cuda else 1):
+        whisper_model = WhisperModel(
+            model_path,
+            device="cuda" if cuda else "cpu",
+            device_index=device_index,
+            compute_type="int8_float16" if cuda else "int8",
+        )
+        pipelines.append(BatchedInferencePipeline(model=whisper_model))
+    return pipelines
+
+def _release_local_models():
+    # free the cached pipelines (and VRAM) when the local toggle turns off
+    if not st.session_state.local_model:
+        import torch
+
+        create_whisper_models.clear()
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+@st.cache_resource()
+def create_executor():
+    """
+    Create the shared thread pool used to overlap transcriptions.
+
     Returns:
-        Whisper: The created whisper model.
+    - ThreadPoolExecutor: The shared worker pool.
     """
-        
-    return whisper.load_model(model_path)
+    import torch
+
+    return ThreadPoolExecutor(max_workers=max(torch.cuda.device_count(), 1) * 2)
 
 @st.cache_data
 def generate_summary(transcripts:str):
@@ -66,39 +124,144 @@ def generate_summary(transcripts:str):
     summary = completion.choices[0].message.content
     return summary
 
-@st.cache_data
-def load_file(file):
-    # Streamlit file uploader returns a BytesIO object
-    # bytes will be saved to a temporary directory
-
-    dest_path = TEMP_DIR / file.name
-    # Save file to destination path
-    with open(dest_path, "wb") as f:
-        f.write(file.getvalue())
-    return dest_path
+def decode_audio(file):
+    # decode in-process to the float32 mono 16kHz array Whisper expects,
+    # skipping the temp-file round-trip and per-file ffmpeg spawn
+    import numpy as np
+    from pydub import AudioSegment
+
+    file.seek(0)
+    segment = AudioSegment.from_file(file).set_channels(1).set_frame_rate(16000)
+    return np.frombuffer(segment.raw_data, np.int16).astype(np.float32) / 32768.0
+
+def _content_key(file):
+    # cache on file contents (not Streamlit's input hashing) so reruns from
+    # unrelated widgets never re-invoke the model; getbuffer avoids copying
+    # the upload just to hash it
+    return (st.session_state.local_model,
+            hashlib.sha256(file.getbuffer()).hexdigest())
+
+# boilerplate phrases Whisper hallucinates on near-silent audio
+BOILERPLATE_PHRASES = ("thanks for watching", "thank you for watching", "please subscribe")
+
+def _keep_segment(text):
+    # reject hallucinated segments: known boilerplate, or any 5-gram
+    # repeated more than 3 times (the n-gram looping failure mode)
+    lowered = text.strip().lower()
+    if any(phrase in lowered for phrase in BOILERPLATE_PHRASES):
+        return False
+    words = lowered.split()
+    counts = {}
+    for i in range(len(words) - 4):
+        gram = tuple(words[i:i + 5])
+        counts[gram] = counts.get(gram, 0) + 1
+        if counts[gram] > 3:
+            return False
+    return True
+
+def _transcribe_local(pipeline, audio):
+    # pure model work, safe to run off the script thread; Silero VAD drops
+    # silent stretches before anything reaches the decoder
+    segments, info = pipeline.transcribe(
+        audio,
+        batch_size=16,
+        vad_filter=True,
+        vad_parameters=dict(min_silence_duration_ms=500, speech_pad_ms=200),
+        condition_on_previous_text=False,
+    )
+    segments = [segment for segment in segments if _keep_segment(segment.text)]
+    text = "".join(segment.text for segment in segments)
+
+    import pandas as pd
+    transcript_df = pd.DataFrame({
+        'start': [segment.start for segment in segments],
+        'end': [segment.end for segment in segments],
+        'text': [segment.text for segment in segments]})
+    return transcript_df, text
 
-@st.cache_data
-def transcribe(dest_path):
-    if st.session_state.local_model:
-        transcription = model.transcribe(str(dest_path))
-        
-    else:
-        audio_file= open(str(dest_path), "rb")
-        transcription = st.session_state.openAI.audio.transcriptions.create(
-        model="whisper-1", 
-        file=audio_file,
-        response_format="verbose_json",
-        )
+async def _transcribe_remote_many(client, files):
+    # fan the uploads out concurrently; the workload is network-bound so
+    # the latencies overlap at the socket layer
+    return await asyncio.gather(*[
+        client.audio.transcriptions.create(
+            model="whisper-1",
+            file=(file.name, file.getvalue()),
+            response_format="verbose_json",
+        ) for file in files])
+
+def _parse_remote(transcription):
+    # the API returns a dict or a typed object depending on client version;
+    # build only the three displayed columns rather than the full wide
+    # frame (tokens, logprobs, ...) just to slice it back down
+    import pandas as pd
     if isinstance(transcription, dict):
         text = transcription['text']
-        transcript_df = pd.DataFrame(transcription['segments'])
+        segments = transcription['segments']
+        transcript_df = pd.DataFrame({
+            'start': [segment['start'] for segment in segments],
+            'end': [segment['end'] for segment in segments],
+            'text': [segment['text'] for segment in segments]})
     else:
         text = transcription.text
-        transcript_df = pd.DataFrame(transcription.segments)
-    transcript_df = transcript_df[['start', 'end', 'text']]
-
+        segments = transcription.segments
+        transcript_df = pd.DataFrame({
+            'start': [segment.start for segment in segments],
+            'end': [segment.end for segment in segments],
+            'text': [segment.text for segment in segments]})
     return transcript_df, text
 
+@st.cache_data
+def df_to_csv_bytes(df) -> bytes:
+    # memoized so reruns don't re-serialize the transcript on every widget click
+    return df.to_csv(index=False).encode('utf-8')
+
+def _decode_and_transcribe(pipeline, file):
+    # decode on the worker so file N+1's pydub/ffmpeg work overlaps the
+    # GPU time of file N (the pool runs two workers per device)
+    return _transcribe_local(pipeline, decode_audio(file))
+
+def transcribe_many(files):
+    """
+    Transcribe a batch of audio files in one dispatch.
+
+    Local transcription fans out round-robin across one pipeline per
+    device on the shared thread pool; remote transcription overlaps the
+    uploads through the async OpenAI client.
+
+    Parameters:
+    - files (list): Uploaded (or recorded) audio files to transcribe.
+
+    Returns:
+    - list[tuple]: One (transcript_df, text) pair per input file.
+    """
+    if "trans_cache" not in st.session_state:
+        st.session_state.trans_cache = {}
+    keys = [_content_key(file) for file in files]
+    missing = {}
+    for file, key in zip(files, keys):
+        if key not in st.session_state.trans_cache and key not in missing:
+            missing[key] = file
+
+    if missing and st.session_state.local_model:
+        pool = create_executor()
+        # dispatch longest files first (size as the duration proxy) so a
+        # long recording never serializes behind a stack of short clips
+        # and the per-device queues stay balanced
+        ordered = sorted(missing.items(), key=lambda item: len(item[1].getbuffer()), reverse=True)
+        futures = {key: pool.submit(_decode_and_transcribe, models[i % len(models)], file)
+                   for i, (key, file) in enumerate(ordered)}
+        with st.spinner("Transcribing..."):
+            for key, future in futures.items():
+                st.session_state.trans_cache[key] = future.result()
+    elif missing:
+        with st.spinner("Transcribing..."):
+            transcriptions = asyncio.run(
+                _transcribe_remote_many(create_async_client(), list(missing.values())))
+        for key, transcription in zip(missing, transcriptions):
+            st.session_state.trans_cache[key] = _parse_remote(transcription)
+
+    return [st.session_state.trans_cache[key] for key in keys]
+
 # Setting page layout
 st.set_page_config(
     page_title="Captain's Log",
@@ -122,11 +285,12 @@ st.title("Captain's Log 🖖📜")
 # Sidebar
 with st.sidebar:
     st.header("Data Upload")
-    st.session_state.local_model = st.toggle("Use Local Whisper", value=False)
+    st.toggle("Use Local Whisper", value=False, key="local_model",
+              on_change=_release_local_models)
 
-    if st.session_state.local_model:
-        # load the whisper model
-        model = create_whisper_model()
+    # cache_resource makes this a lookup after the first load, so flipping
+    # the toggle never double-loads the weights
+    models = create_whisper_models() if st.session_state.local_model else None
 
     audio_files = st.sidebar.file_uploader(
         "Select Audio or Video File", 
@@ -138,16 +302,12 @@ with st.sidebar:
     if st.button("Clear Recording"):
         recording = None
     if recording is not None and len(recording)> 0:
-        # its a pain in the ass to deal with this see if we can clean it later
-        file = recording.export(TEMP_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}_Captains_Log.wav", format="wav")
+        # export once to memory; the recording never touches disk
         audio_stream = BytesIO()
         recording.export(audio_stream, format='wav')
-        audio_stream.seek(0)
-        file.file_id = 'recording'
-        file.type = "audio/wav"
-        file.data = audio_stream.getvalue()
-        file = UploadedFile(record = file, file_urls=TEMP_DIR / f"audio.wav")
-        
+        file = RecordedFile(audio_stream.getvalue(),
+                            f"{time.strftime('%Y%m%d-%H%M%S')}_Captains_Log.wav")
+
         # show the recording
         st.header("Your recording")
         recording
@@ -158,29 +318,34 @@ with st.sidebar:
 
 
 if len(audio_files)>0:
-    transcripts = ""
+    transcript_parts = []
     for file in audio_files:
         # rename becase I am a hack
         file.name = file.name.split('\\')[-1]
         # file.name = 'test'
-        dest_path = load_file(file)
 
-        transcription_df, text = transcribe(str(dest_path))
-        transcripts = transcripts + f'{file.name}: \n\n {text}\n\n'
+    # decode in-process and run the transcription as one batch
+    results = transcribe_many(audio_files)
+
+    for file, (transcription_df, text) in zip(audio_files, results):
+        transcript_parts.append(f'{file.name}: \n\n {text}\n\n')
+        base_name = file.name.split('.')[0]
         with st.expander(file.name):
-            
-            st.video(str(dest_path))
+
+            st.video(file.getvalue())
 
             st.write(transcription_df)
 
-            st.markdown(transcripts)
+            st.markdown("".join(transcript_parts))
 
             st.download_button(
                 label="Download Transcript",
-                data=transcription_df.to_csv(index=False).encode('utf-8'),
-                file_name='transcript_' + file.name.split('.')[0] + '.csv',
+                data=df_to_csv_bytes(transcription_df),
+                file_name='transcript_' + base_name + '.csv',
                 mime="text/csv")
 
+    transcripts = "".join(transcript_parts)
+
     if st.button("Generate Summary"):
         st.session_state.summary = generate_summary(transcripts=transcripts)
     